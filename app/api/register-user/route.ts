@@ -4,9 +4,9 @@ import { NextResponse } from 'next/server';
  * Calls the external Python microservice to generate a voiceprint embedding.
  * @param audioFile The audio file blob to be processed.
  * @param name The name of the user to associate with the voiceprint.
- * @returns A promise that resolves to a voiceprint embedding (a float array).
+ * @returns A promise that resolves to a voiceprint embedding (base64-encoded little-endian Float32 bytes).
  */
-async function generateVoiceprint(audioFile: File, name: string): Promise<number[]> {
+async function generateVoiceprint(audioFile: File, name: string): Promise<string> {
   const pythonServiceUrl = process.env.VOICEPRINT_SERVICE_URL;
   if (!pythonServiceUrl) {
     throw new Error("VOICEPRINT_SERVICE_URL is not configured in .env.local");
@@ -31,7 +31,7 @@ async function generateVoiceprint(audioFile: File, name: string): Promise<number
 
   const result = await response.json();
   console.log("Voiceprint generation successful.");
-  return result.embedding;
+  return result.embedding_b64;
 }
 
 
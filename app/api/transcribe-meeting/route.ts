@@ -17,9 +17,58 @@ interface ProcessedData {
   }>;
 }
 
+type EnrolledVoiceprints = Record<string, string | number[]>;
+
+/**
+ * Packs voiceprints (base64 Float32 bytes or float arrays) into one contiguous
+ * little-endian Float32 [N, D] buffer plus its row order.
+ * Rows whose size differs from the most common one are dropped and logged.
+ * Returns null when there is nothing to send.
+ */
+function packVoiceprintMatrix(voiceprints: EnrolledVoiceprints): { names: string[]; matrix: Buffer } | null {
+  const rows = new Map<string, Buffer>();
+  const sizeCounts = new Map<number, number>();
+  for (const [name, voiceprint] of Object.entries(voiceprints)) {
+    let row: Buffer;
+    if (typeof voiceprint === 'string') {
+      row = Buffer.from(voiceprint, 'base64');
+    } else {
+      row = Buffer.alloc(voiceprint.length * 4);
+      voiceprint.forEach((value, i) => row.writeFloatLE(value, i * 4));
+    }
+    if (row.length === 0 || row.length % 4 !== 0) {
+      console.warn(`⚠️ Dropping malformed voiceprint for: ${name} (${row.length} bytes)`);
+      continue;
+    }
+    rows.set(name, row);
+    sizeCounts.set(row.length, (sizeCounts.get(row.length) ?? 0) + 1);
+  }
+
+  let rowSize = 0;
+  let rowSizeCount = 0;
+  for (const [size, count] of sizeCounts) {
+    if (count > rowSizeCount) {
+      rowSize = size;
+      rowSizeCount = count;
+    }
+  }
+
+  const names: string[] = [];
+  const kept: Buffer[] = [];
+  for (const [name, row] of rows) {
+    if (row.length !== rowSize) {
+      console.warn(`⚠️ Dropping voiceprint for: ${name} (${row.length / 4} floats, expected ${rowSize / 4})`);
+      continue;
+    }
+    names.push(name);
+    kept.push(row);
+  }
+  return kept.length > 0 ? { names, matrix: Buffer.concat(kept) } : null;
+}
+
 async function processWithTranscriptionService(
   audioFile: File, 
-  voiceprints: Record<string, number[]>
+  voiceprints: EnrolledVoiceprints
 ): Promise<ProcessedData> {
   const serviceUrl = process.env.TRANSCRIPTION_SERVICE_URL || "http://localhost:5002/process-audio";
   
@@ -30,7 +79,15 @@ async function processWithTranscriptionService(
   const formData = new FormData();
   // IMPORTANT: Match the field names that Python FastAPI expects
   formData.append('audio_file', audioFile);  // Changed from 'audioFile' to 'audio_file'
-  formData.append('enrolled_voiceprints_json', JSON.stringify(voiceprints));
+  const packed = packVoiceprintMatrix(voiceprints);
+  if (packed) {
+    // Raw Float32 rows decode server-side in a single read, with no JSON or base64 parsing
+    formData.append('enrolled_voiceprints', new Blob([packed.matrix]), 'voiceprints.f32');
+    formData.append('enrolled_names_json', JSON.stringify({ names: packed.names }));
+  } else {
+    // Nothing usable to enroll: the legacy JSON field with an empty roster marks every speaker unresolved
+    formData.append('enrolled_voiceprints_json', JSON.stringify({}));
+  }
 
   console.log("📤 Sending audio and voiceprints to Python transcription service...");
   console.log(`   Service URL: ${serviceUrl}`);
@@ -95,7 +152,7 @@ export async function POST(request: Request) {
       );
     }
 
-    let enrolledVoiceprints: Record<string, number[]>;
+    let enrolledVoiceprints: EnrolledVoiceprints;
     try {
       enrolledVoiceprints = JSON.parse(voiceprintsJson);
       
@@ -74,7 +74,11 @@ export async function fetchTeamVoiceprints(teamId: string): Promise<Record<strin
       const userName = userData.name;
       const voiceprint = userData.voiceprint;
 
-      if (voiceprint && Array.isArray(voiceprint) && voiceprint.length > 0) {
+      if (typeof voiceprint === 'string' && voiceprint.length > 0) {
+        // Newer profiles store the voiceprint service's base64 Float32 bytes as-is
+        voiceprints[userName] = voiceprint;
+        console.log(`  ✅ Loaded voiceprint for: ${userName}`);
+      } else if (voiceprint && Array.isArray(voiceprint) && voiceprint.length > 0) {
         const encoded = floatArrayToBase64(voiceprint);
         voiceprints[userName] = encoded;
         console.log(`  ✅ Encoded voiceprint for: ${userName} (${voiceprint.length} floats)`);
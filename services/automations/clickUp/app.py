@@ -1,13 +1,26 @@
 import os
-import json
-import requests
+import asyncio
+import functools
+import hashlib
+import io
+import itertools
 import logging
-from typing import Dict, List, Any
+import string
+import threading
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from typing import Dict, List, Any, Callable, Awaitable, Iterator, Optional, Tuple
 from datetime import datetime
 
+import httpx
+import orjson
+from cachetools import TTLCache
+
 import google.generativeai as genai
+from google.generativeai import protos
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Security
+from fastapi import FastAPI, HTTPException, Security, Header, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
@@ -17,6 +30,8 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
+# httpx logs every request at INFO; only surface its warnings
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # --- 1. CONFIGURATION and SETUP ---
@@ -31,69 +46,151 @@ logger.info(f"✅ API Key loaded: {GEMINI_API_KEY[:10]}..." if len(GEMINI_API_KE
 genai.configure(api_key=GEMINI_API_KEY)
 token_auth_scheme = HTTPBearer()
 
+# ClickUp retry policy for transient failures and rate limiting
+MAX_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# ClickUp returns at most this many tasks per page; later pages are fetched this many at a time
+TASK_PAGE_SIZE = 100
+TASK_PAGE_BATCH = 4
+
+# Space metadata changes on human timescales, so keep it across requests.
+# Keys are (token fingerprint, space_id/list_id) so users never share entries.
+METADATA_CACHE_TTL = 300
+SPACE_DETAILS_CACHE = TTLCache(maxsize=512, ttl=METADATA_CACHE_TTL)
+SPACE_LISTS_CACHE = TTLCache(maxsize=512, ttl=METADATA_CACHE_TTL)
+TEAM_USERS_CACHE = TTLCache(maxsize=512, ttl=METADATA_CACHE_TTL)
+CUSTOM_FIELDS_CACHE = TTLCache(maxsize=512, ttl=METADATA_CACHE_TTL)
+
+# One keep-alive (HTTP/2) pool shared by every request the service makes to ClickUp.
+# The transport retries failed connects; retryable status codes are handled in _make_request.
+CLICKUP_BASE_URL = "https://api.clickup.com/api/v2/"
+_clickup_http_client: Optional[httpx.AsyncClient] = None
+
+def get_clickup_http_client() -> httpx.AsyncClient:
+    """Return the shared ClickUp HTTP client, creating it on first use"""
+    global _clickup_http_client
+    if _clickup_http_client is None:
+        _clickup_http_client = httpx.AsyncClient(
+            base_url=CLICKUP_BASE_URL,
+            headers={"Content-Type": "application/json"},
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=MAX_RETRIES,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            ),
+            timeout=httpx.Timeout(30.0, connect=5.0, pool=None)
+        )
+        logger.info("✅ ClickUp HTTP client initialized")
+    return _clickup_http_client
+
+async def close_clickup_http_client():
+    """Release the pooled connections held by the shared HTTP client"""
+    global _clickup_http_client
+    if _clickup_http_client is not None:
+        await _clickup_http_client.aclose()
+        _clickup_http_client = None
+
 # --- 2. CLICKUP API CLIENT CLASS ---
-class ClickUpClient:
-    def __init__(self, api_token: str):
+class AsyncClickUpClient:
+    def __init__(self, api_token: str, refresh: bool = False):
         if not api_token:
             raise ValueError("ClickUp API token is required for the client.")
         self.api_token = api_token
-        self.base_url = "https://api.clickup.com/api/v2/"
-        self.headers = {"Authorization": self.api_token, "Content-Type": "application/json"}
-        logger.info("✅ ClickUpClient initialized")
+        self.token_key = hashlib.sha256(api_token.encode()).hexdigest()[:16]
+        self.refresh = refresh
+        # In-flight fetches, so concurrent callers asking for the same resource share one request
+        self._pending_fetches: Dict[Tuple[int, str], asyncio.Task] = {}
+        # The connection pool is shared across users, so the token travels per request
+        self.headers = {"Authorization": self.api_token}
+        logger.info("✅ AsyncClickUpClient initialized")
 
-    def _make_request(self, method: str, endpoint: str, params: Dict = None, json_data: Dict = None) -> Any:
+    async def _make_request(self, method: str, endpoint: str, params: Dict = None, json_data: Dict = None) -> Any:
         """Make a request to ClickUp API with improved error handling"""
-        url = self.base_url + endpoint
-        logger.info(f"🌐 Making {method} request to ClickUp: {endpoint}")
+        logger.debug("🌐 Making %s request to ClickUp: %s", method, endpoint)
         
         try:
-            response = requests.request(
-                method, 
-                url, 
-                headers=self.headers, 
-                params=params,
-                json=json_data
-            )
+            for attempt in range(MAX_RETRIES + 1):
+                response = await get_clickup_http_client().request(
+                    method, 
+                    endpoint, 
+                    params=params,
+                    json=json_data,
+                    headers=self.headers
+                )
+                if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                    break
+                await asyncio.sleep(RETRY_BACKOFF_FACTOR * (2 ** attempt))
             response.raise_for_status()
-            logger.info(f"✅ ClickUp API request successful: {endpoint}")
-            return response.json()
-        except requests.exceptions.HTTPError as e:
+            logger.debug("✅ ClickUp API request successful: %s", endpoint)
+            return orjson.loads(response.content)
+        except httpx.HTTPStatusError as e:
             logger.error(f"❌ ClickUp API HTTP Error: {e.response.status_code} - {e.response.text}")
             raise HTTPException(
                 status_code=e.response.status_code, 
                 detail=f"ClickUp API Error: {e.response.text}"
             )
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"❌ Network error connecting to ClickUp: {str(e)}")
             raise HTTPException(
                 status_code=503, 
                 detail=f"Network error connecting to ClickUp: {str(e)}"
             )
 
-    def get_space_details(self, space_id: str) -> Dict[str, Any]:
+    async def _cached(self, cache: TTLCache, resource_id: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a cached value for this token, fetching it unless the caller asked for a refresh"""
+        key = (self.token_key, resource_id)
+        if not self.refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                logger.debug("⚡ Cache hit: %s", resource_id)
+                return cached
+        
+        pending_key = (id(cache), resource_id)
+        task = self._pending_fetches.get(pending_key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._pending_fetches[pending_key] = task
+            task.add_done_callback(lambda _: self._pending_fetches.pop(pending_key, None))
+        # Shield so one cancelled caller doesn't cancel the fetch for the others
+        value = await asyncio.shield(task)
+        cache[key] = value
+        return value
+
+    async def get_space_details(self, space_id: str) -> Dict[str, Any]:
+        return await self._cached(SPACE_DETAILS_CACHE, space_id, lambda: self._fetch_space_details(space_id))
+
+    async def _fetch_space_details(self, space_id: str) -> Dict[str, Any]:
         logger.info(f"📋 Fetching space details for space_id: {space_id}")
-        return self._make_request("GET", f"space/{space_id}")
+        return await self._make_request("GET", f"space/{space_id}")
+
+    async def get_all_lists_in_space(self, space_id: str) -> List[Dict[str, Any]]:
+        return await self._cached(SPACE_LISTS_CACHE, space_id, lambda: self._fetch_all_lists_in_space(space_id))
 
-    def get_all_lists_in_space(self, space_id: str) -> List[Dict[str, Any]]:
+    async def _fetch_all_lists_in_space(self, space_id: str) -> List[Dict[str, Any]]:
         logger.info(f"📝 Fetching all lists in space: {space_id}")
         all_lists = []
         try:
             # Get folderless lists
-            folderless_lists_data = self._make_request("GET", f"space/{space_id}/list")
+            folderless_lists_data = await self._make_request("GET", f"space/{space_id}/list")
             folderless_count = len(folderless_lists_data.get("lists", []))
             all_lists.extend(folderless_lists_data.get("lists", []))
             logger.info(f"  └─ Found {folderless_count} folderless lists")
             
             # Get folders and their lists
-            folders_data = self._make_request("GET", f"space/{space_id}/folder")
+            folders_data = await self._make_request("GET", f"space/{space_id}/folder")
             folders = folders_data.get("folders", [])
             logger.info(f"  └─ Found {len(folders)} folders")
             
-            for folder in folders:
-                lists_in_folder_data = self._make_request("GET", f"folder/{folder['id']}/list")
+            # Folders are independent, so fetch their lists concurrently (gather keeps folder order)
+            folder_results = await asyncio.gather(*[
+                self._make_request("GET", f"folder/{folder['id']}/list") for folder in folders
+            ])
+            for folder, lists_in_folder_data in zip(folders, folder_results):
                 folder_lists = lists_in_folder_data.get("lists", [])
                 all_lists.extend(folder_lists)
-                logger.info(f"     └─ Folder '{folder.get('name')}': {len(folder_lists)} lists")
+                logger.debug("     └─ Folder '%s': %d lists", folder.get('name'), len(folder_lists))
         except HTTPException as e:
             if e.status_code != 404:
                 raise
@@ -102,104 +199,171 @@ class ClickUpClient:
         logger.info(f"✅ Total lists found: {len(all_lists)}")
         return all_lists
 
-    def get_all_tasks_in_space(self, space_id: str) -> List[Dict[str, Any]]:
+    async def _fetch_task_page(self, list_id: str, page: int) -> Dict[str, Any]:
+        params = {"page": page, "subtasks": "true"}
+        return await self._make_request("GET", f"list/{list_id}/task", params=params)
+
+    @staticmethod
+    def _is_last_page(data: Dict[str, Any]) -> bool:
+        return data.get("last_page", False) or len(data.get("tasks", [])) < TASK_PAGE_SIZE
+
+    async def _fetch_list_tasks(self, list_item: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Fetch every page of tasks for a single list"""
+        list_id = list_item['id']
+        
+        # Most lists fit on one page, so only speculate once the first page comes back full
+        first_page = await self._fetch_task_page(list_id, 0)
+        list_tasks = list(first_page.get("tasks", []))
+        if self._is_last_page(first_page):
+            return list_tasks
+        
+        page = 1
+        while True:
+            batch = await asyncio.gather(*[
+                self._fetch_task_page(list_id, p) for p in range(page, page + TASK_PAGE_BATCH)
+            ])
+            for data in batch:
+                list_tasks.extend(data.get("tasks", []))
+                if self._is_last_page(data):
+                    return list_tasks
+            page += TASK_PAGE_BATCH
+
+    async def get_all_tasks_in_space(self, space_id: str) -> List[Dict[str, Any]]:
         logger.info(f"📊 Fetching all tasks in space: {space_id}")
-        all_lists = self.get_all_lists_in_space(space_id)
+        all_lists = await self.get_all_lists_in_space(space_id)
         all_tasks = []
         
-        for idx, list_item in enumerate(all_lists, 1):
-            list_name = list_item.get('name', 'Unknown')
-            list_id = list_item['id']
-            logger.info(f"  [{idx}/{len(all_lists)}] Fetching tasks from list: '{list_name}'")
-            
-            page = 0
-            list_task_count = 0
-            while True:
-                params = {"page": page, "subtasks": "true"}
-                data = self._make_request("GET", f"list/{list_id}/task", params=params)
-                tasks = data.get("tasks", [])
-                if not tasks:
-                    break
-                all_tasks.extend(tasks)
-                list_task_count += len(tasks)
-                page += 1
-            
-            logger.info(f"     └─ Found {list_task_count} tasks")
+        # Paginate every list concurrently; lists have no data dependency on each other
+        tasks_per_list = await asyncio.gather(*[self._fetch_list_tasks(l) for l in all_lists])
+        for idx, (list_item, list_tasks) in enumerate(zip(all_lists, tasks_per_list), 1):
+            all_tasks.extend(list_tasks)
+            logger.debug("  [%d/%d] List '%s': %d tasks", idx, len(all_lists), list_item.get('name', 'Unknown'), len(list_tasks))
         
         logger.info(f"✅ Total tasks found: {len(all_tasks)}")
         return all_tasks
 
-    def get_team_users(self) -> List[Dict[str, Any]]:
+    async def get_team_users(self) -> List[Dict[str, Any]]:
+        return await self._cached(TEAM_USERS_CACHE, "team", self._fetch_team_users)
+
+    async def _fetch_team_users(self) -> List[Dict[str, Any]]:
         logger.info("👥 Fetching team users")
-        teams_data = self._make_request("GET", "team")
+        teams_data = await self._make_request("GET", "team")
         teams = teams_data.get("teams", [])
         members = teams[0].get("members", []) if teams else []
         logger.info(f"✅ Found {len(members)} team members")
         return members
 
-    def get_custom_fields(self, list_id: str) -> List[Dict[str, Any]]:
+    async def get_custom_fields(self, list_id: str) -> Tuple[Dict[str, Any], ...]:
+        # Failed lookups fall back to no fields and are not cached
         try:
-            fields_data = self._make_request("GET", f"list/{list_id}/field")
-            fields = fields_data.get("fields", [])
-            return fields
+            return await self._cached(CUSTOM_FIELDS_CACHE, list_id, lambda: self._fetch_custom_fields(list_id))
         except HTTPException:
-            return []
+            return ()
+
+    async def _fetch_custom_fields(self, list_id: str) -> Tuple[Dict[str, Any], ...]:
+        # Stored as a tuple since the cached value is shared across requests
+        fields_data = await self._make_request("GET", f"list/{list_id}/field")
+        return tuple(fields_data.get("fields", []))
 
 # --- 3. DATA FILTERING and PROMPT GENERATION ---
-def filter_clickup_tasks(raw_tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Filter and structure task data for AI processing"""
-    logger.info(f"🔍 Filtering {len(raw_tasks)} tasks for AI processing")
-    filtered_tasks = []
+_EMPTY: Dict[str, Any] = {}
+
+# The board state is sent to Gemini column-wise so key names are not repeated per task.
+# Documented for the model under "Board State Format" in system_prompt_template.txt.
+BOARD_STATE_COLUMNS = ["id", "name", "status", "assignee", "parent_id", "list_id", "dependencies"]
+
+def _filter_task(task: Dict[str, Any]) -> List[Any]:
+    """Reduce a raw ClickUp task to a board-state row (ordered as BOARD_STATE_COLUMNS)"""
+    get = task.get
+    task_id = get("id")
     
-    for task in raw_tasks:
-        assignees = [
-            a.get("username") or a.get("email") 
-            for a in task.get("assignees", []) if a
-        ]
-        assignee_field = assignees[0] if len(assignees) == 1 else assignees if assignees else None
-        
-        filtered_task = {
-            "id": task.get("id"),
-            "name": task.get("name"),
-            "status": task.get("status", {}).get("status"),
-            "assignee": assignee_field
-        }
-        
-        if task.get("parent"):
-            filtered_task["parent_id"] = task.get("parent")
+    # Most tasks have zero or one assignee; only allocate a list when there are several
+    assignee_field = None
+    extra_assignees = None
+    assignee_count = 0
+    for a in get("assignees") or ():
+        if not a:
+            continue
+        assignee = a.get("username") or a.get("email")
+        assignee_count += 1
+        if assignee_count == 1:
+            assignee_field = assignee
+        elif assignee_count == 2:
+            extra_assignees = [assignee_field, assignee]
         else:
-            filtered_task["list"] = {
-                "id": task.get("list", {}).get("id"), 
-                "name": task.get("list", {}).get("name")
-            }
-        
-        dependencies = task.get("dependencies", [])
-        if dependencies:
-            waiting_on_ids = [
-                dep.get("depends_on") for dep in dependencies 
-                if dep.get("depends_on") and dep.get("task_id") == task.get("id")
-            ]
-            if waiting_on_ids:
-                filtered_task["dependencies"] = waiting_on_ids
-        
-        filtered_tasks.append(filtered_task)
+            extra_assignees.append(assignee)
+    if extra_assignees is not None:
+        assignee_field = extra_assignees
+    
+    # Subtasks are located by their parent; top-level tasks by their list
+    parent_id = get("parent") or None
+    list_id = None if parent_id else get("list", _EMPTY).get("id")
+    
+    waiting_on_ids = None
+    dependencies = get("dependencies")
+    if dependencies:
+        waiting_on_ids = [
+            depends_on for dep in dependencies
+            if (depends_on := dep.get("depends_on")) and dep.get("task_id") == task_id
+        ] or None
     
-    logger.info(f"✅ Filtered {len(filtered_tasks)} tasks")
-    return filtered_tasks
+    return [
+        task_id,
+        get("name"),
+        get("status", _EMPTY).get("status"),
+        assignee_field,
+        parent_id,
+        list_id,
+        waiting_on_ids
+    ]
+
+def filter_clickup_tasks(raw_tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Filter and structure task data for AI processing as {"columns": [...], "rows": [[...], ...]}"""
+    logger.info(f"🔍 Filtering {len(raw_tasks)} tasks for AI processing")
+    rows = [_filter_task(task) for task in raw_tasks]
+    logger.info(f"✅ Filtered {len(rows)} tasks")
+    return {"columns": BOARD_STATE_COLUMNS, "rows": rows}
+
+TemplateSegments = List[Tuple[str, Optional[str]]]
+
+def _compile_template(template_content: str) -> TemplateSegments:
+    """Split a str.format template into (literal_text, placeholder_name) pairs so it is parsed only once"""
+    segments = []
+    for literal_text, field_name, format_spec, conversion in string.Formatter().parse(template_content):
+        if format_spec or conversion:
+            raise ValueError(f"Unsupported placeholder '{{{field_name}}}': format specs and conversions are not allowed")
+        segments.append((literal_text, field_name))
+    return segments
+
+def _render_template(segments: TemplateSegments, values: Dict[str, str]) -> str:
+    """Fill a compiled template; raises KeyError for a placeholder missing from values, like str.format"""
+    parts = []
+    for literal_text, field_name in segments:
+        parts.append(literal_text)
+        if field_name is not None:
+            parts.append(values[field_name])
+    return "".join(parts)
+
+@functools.lru_cache(maxsize=4)
+def _load_template(template_path: str) -> TemplateSegments:
+    """Read and compile the prompt template once per path; later requests reuse the cached segments"""
+    logger.info(f"📄 Loading prompt template from: {template_path}")
+    
+    if not os.path.exists(template_path):
+        logger.error(f"❌ Prompt template file not found: {template_path}")
+        raise FileNotFoundError(f"Prompt template file not found: {template_path}")
+    
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template_content = f.read()
+    
+    segments = _compile_template(template_content)
+    logger.info(f"✅ Prompt template loaded ({len(template_content)} characters, {len(segments)} segments)")
+    return segments
 
 class PromptGenerator:
-    def __init__(self, client: ClickUpClient, template_path: str = "system_prompt_template.txt"):
+    def __init__(self, client: AsyncClickUpClient, template_path: str = "system_prompt_template.txt"):
         self.client = client
-        logger.info(f"📄 Loading prompt template from: {template_path}")
-        
-        if not os.path.exists(template_path):
-            logger.error(f"❌ Prompt template file not found: {template_path}")
-            raise FileNotFoundError(f"Prompt template file not found: {template_path}")
-        
-        with open(template_path, 'r', encoding='utf-8') as f:
-            self.template_content = f.read()
-        
-        logger.info(f"✅ Prompt template loaded ({len(self.template_content)} characters)")
+        self.template_segments = _load_template(template_path)
     
     def _format_statuses(self, details: Dict) -> str:
         """Format status dictionary for prompt"""
@@ -208,50 +372,57 @@ class PromptGenerator:
             for s in details.get("statuses", [])
         ])
     
+    # The formatters below write newline-terminated lines straight into one buffer
+    # and drop the final newline, instead of building an intermediate list to join.
     def _format_lists(self, lists: List[Dict]) -> str:
         """Format lists dictionary for prompt"""
-        return "\n".join([
-            f'- {{"list_id": "{l.get("id")}", "list_name": "{l.get("name")}"}}' 
-            for l in lists
-        ])
+        buf = io.StringIO()
+        w = buf.write
+        for l in lists:
+            w(f'- {{"list_id": "{l.get("id")}", "list_name": "{l.get("name")}"}}\n')
+        return buf.getvalue()[:-1]
     
     def _format_assignees(self, users: List[Dict]) -> str:
         """Format assignees dictionary for prompt"""
-        formatted_users = []
+        buf = io.StringIO()
+        w = buf.write
         for u in users:
             user_data = u.get("user", {})
             if user_data.get("id") and user_data.get("username"):
-                formatted_users.append(
-                    f'- {{"user_id": {user_data["id"]}, "username": "{user_data["username"]}"}}'
-                )
-        return "\n".join(formatted_users) if formatted_users else "No users found."
+                w(f'- {{"user_id": {user_data["id"]}, "username": "{user_data["username"]}"}}\n')
+        return buf.getvalue()[:-1] or "No users found."
     
     def _format_custom_fields(self, fields_map: Dict) -> str:
         """Format custom fields dictionary for prompt"""
-        lines = []
+        buf = io.StringIO()
+        w = buf.write
         for list_id, data in fields_map.items():
-            if data['fields']:
-                lines.append(f'For list "{data["list_name"]}" (id: {list_id}):')
-                for field in data['fields']:
-                    lines.append(
-                        f'  - {{"id": "{field["id"]}", "name": "{field["name"]}", "type": "{field["type"]}"}}'
-                    )
-        return "\n".join(lines) if lines else "No custom fields found."
+            if not data['fields']:
+                continue
+            w(f'For list "{data["list_name"]}" (id: {list_id}):\n')
+            for field in data['fields']:
+                w(f'  - {{"id": "{field["id"]}", "name": "{field["name"]}", "type": "{field["type"]}"}}\n')
+        return buf.getvalue()[:-1] or "No custom fields found."
     
-    def create_system_prompt(self, space_id: str) -> str:
+    async def create_system_prompt(self, space_id: str) -> str:
         """Create formatted system prompt with live project data"""
         logger.info(f"🔧 Creating system prompt for space: {space_id}")
         
-        space_details = self.client.get_space_details(space_id)
-        project_lists = self.client.get_all_lists_in_space(space_id)
-        team_users = self.client.get_team_users()
+        # Space details, lists and users are independent lookups
+        space_details, project_lists, team_users = await asyncio.gather(
+            self.client.get_space_details(space_id),
+            self.client.get_all_lists_in_space(space_id),
+            self.client.get_team_users()
+        )
         
         logger.info("🔧 Fetching custom fields for all lists")
+        list_ids = list(dict.fromkeys(l['id'] for l in project_lists))
+        fields_by_id = dict(zip(list_ids, await asyncio.gather(*[self.client.get_custom_fields(list_id) for list_id in list_ids])))
         fields_by_list = {}
         for l in project_lists:
             fields_by_list[l['id']] = {
                 'list_name': l['name'], 
-                'fields': self.client.get_custom_fields(l['id'])
+                'fields': fields_by_id[l['id']]
             }
         
         # Create the data dictionary with all required placeholders
@@ -264,7 +435,7 @@ class PromptGenerator:
         }
         
         try:
-            system_prompt = self.template_content.format(**format_dict)
+            system_prompt = _render_template(self.template_segments, format_dict)
             logger.info(f"✅ System prompt created ({len(system_prompt)} characters)")
             return system_prompt
         except KeyError as e:
@@ -278,42 +449,91 @@ class PromptGenerator:
             )
             raise HTTPException(status_code=500, detail=error_detail)
 
-def call_gemini_api(system_prompt: str, board_state: List[Dict], transcript: str) -> str:
-    """Call Gemini API with error handling"""
+GEMINI_MODEL_NAME = 'models/gemini-2.5-pro'
+GENERATION_CONFIG = MappingProxyType({
+    "temperature": 0.3,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+})
+
+# Exact-match cache of Gemini responses, keyed by a digest of the full model input
+# (Gemini calls run in worker threads, so access goes through the lock.)
+GEMINI_RESPONSE_CACHE = TTLCache(maxsize=256, ttl=1800)
+GEMINI_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def _gemini_cache_key(system_prompt: str, board_bytes: bytes, transcript: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(system_prompt.encode())
+    digest.update(b"|")
+    digest.update(board_bytes)
+    digest.update(b"|")
+    digest.update(transcript.encode())
+    return digest.digest()
+
+# Fixed text surrounding the board state and transcript in the user turn
+USER_PROMPT_BOARD_HEADER = (
+    "\nHere is the current state of the project board in JSON format:\n"
+    "<BOARD_STATE>\n"
+)
+USER_PROMPT_TRANSCRIPT_HEADER = (
+    "\n</BOARD_STATE>\n"
+    "\n"
+    "Here is the transcript of a recent meeting or a user request to analyze:\n"
+    "<TRANSCRIPT>\n"
+)
+USER_PROMPT_FOOTER = (
+    "\n</TRANSCRIPT>\n"
+    "\n"
+    "Based on all the provided context, please provide your response as a valid JSON array "
+    "following the output schema defined in your instructions.\n"
+)
+
+@functools.lru_cache(maxsize=8)
+def _get_model(system_prompt: str) -> genai.GenerativeModel:
+    """Build (once per distinct system prompt) the Gemini model used for action generation"""
+    logger.info("🧠 Creating Gemini model for new system prompt")
+    return genai.GenerativeModel(
+        model_name=GEMINI_MODEL_NAME,
+        system_instruction=system_prompt,
+        generation_config=dict(GENERATION_CONFIG)
+    )
+
+def _prepare_gemini_request(system_prompt: str, board_state: Dict[str, Any], transcript: str) -> Tuple[bytes, List[str]]:
+    """Build the response-cache key and the user-turn parts for a Gemini call"""
     logger.info("🤖 Preparing Gemini API call")
-    logger.info(f"  └─ Board state: {len(board_state)} tasks")
+    logger.info(f"  └─ Board state: {len(board_state['rows'])} tasks")
     logger.info(f"  └─ Transcript length: {len(transcript)} characters")
     
-    generation_config = {
-        "temperature": 0.3,
-        "top_p": 0.95,
-        "top_k": 40,
-        "max_output_tokens": 8192,
-    }
+    # Compact JSON: indentation only adds input tokens for Gemini
+    board_bytes = orjson.dumps(board_state)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"  └─ Board state:\n{orjson.dumps(board_state, option=orjson.OPT_INDENT_2).decode()}")
+    
+    cache_key = _gemini_cache_key(system_prompt, board_bytes, transcript)
     
+    # Send the user turn as separate text parts so the (possibly large) board JSON
+    # is never copied into one concatenated prompt string
+    user_prompt_parts = [USER_PROMPT_BOARD_HEADER, board_bytes.decode(), USER_PROMPT_TRANSCRIPT_HEADER, transcript, USER_PROMPT_FOOTER]
+    return cache_key, user_prompt_parts
+
+def _get_cached_gemini_response(cache_key: bytes) -> Optional[str]:
+    with GEMINI_RESPONSE_CACHE_LOCK:
+        cached_response = GEMINI_RESPONSE_CACHE.get(cache_key)
+    if cached_response is not None:
+        logger.info(f"⚡ Returning cached Gemini response ({len(cached_response)} characters)")
+    return cached_response
+
+def call_gemini_api(system_prompt: str, board_state: Dict[str, Any], transcript: str, use_cache: bool = True) -> str:
+    """Call Gemini API with error handling"""
     try:
-        model = genai.GenerativeModel(
-            model_name='models/gemini-2.5-pro',
-            system_instruction=system_prompt,
-            generation_config=generation_config
-        )
-        
-        user_prompt = f"""
-Here is the current state of the project board in JSON format:
-<BOARD_STATE>
-{json.dumps(board_state, indent=2)}
-</BOARD_STATE>
-
-Here is the transcript of a recent meeting or a user request to analyze:
-<TRANSCRIPT>
-{transcript}
-</TRANSCRIPT>
-
-Based on all the provided context, please provide your response as a valid JSON array following the output schema defined in your instructions.
-"""
+        cache_key, user_prompt_parts = _prepare_gemini_request(system_prompt, board_state, transcript)
+        if use_cache and (cached_response := _get_cached_gemini_response(cache_key)) is not None:
+            return cached_response
         
+        model = _get_model(system_prompt)
         logger.info("🚀 Calling Gemini 2.5 Pro API...")
-        response = model.generate_content(user_prompt)
+        response = model.generate_content(user_prompt_parts)
         
         # Check if response is blocked or has issues
         if not response.text:
@@ -323,6 +543,8 @@ Based on all the provided context, please provide your response as a valid JSON
         logger.info(f"✅ Gemini API response received ({len(response.text)} characters)")
         logger.info(f"  └─ Response preview: {response.text[:200]}...")
         
+        with GEMINI_RESPONSE_CACHE_LOCK:
+            GEMINI_RESPONSE_CACHE[cache_key] = response.text
         return response.text
         
     except Exception as e:
@@ -333,21 +555,127 @@ Based on all the provided context, please provide your response as a valid JSON
             detail=f"Error calling Gemini API: {error_msg}"
         )
 
+# Appended to a streamed response that fails after the first chunk was sent, since the
+# 200 status can no longer be changed; clients must treat a body ending in it as failed
+GEMINI_STREAM_ERROR_MARKER = "\n[STREAM_ERROR] Gemini stream interrupted; response is incomplete.\n"
+FinishReason = protos.Candidate.FinishReason
+GEMINI_STREAM_OK_FINISH_REASONS = frozenset({FinishReason.STOP, FinishReason.MAX_TOKENS})
+
+def _read_stream_chunk(chunk: Any) -> Tuple[str, Any]:
+    """
+    Return a streamed chunk's text and its candidate's finish_reason. Chunks without parts
+    (e.g. a trailing finish_reason/usage chunk) give "" instead of raising like `chunk.text`;
+    a blocked prompt (no candidates at all) still raises ValueError.
+    """
+    parts = chunk.parts
+    finish_reason = chunk.candidates[0].finish_reason
+    return (chunk.text if parts else ""), finish_reason
+
+def stream_gemini_api(system_prompt: str, board_state: Dict[str, Any], transcript: str, use_cache: bool = True) -> Iterator[str]:
+    """
+    Start a streaming Gemini call and return an iterator over the response text.
+    The request is sent and its first non-empty chunk received before this returns, so
+    errors and empty/blocked responses raise a 500 like call_gemini_api; the full text is
+    buffered while streaming so it can be cached once the stream completes.
+    """
+    try:
+        cache_key, user_prompt_parts = _prepare_gemini_request(system_prompt, board_state, transcript)
+        if use_cache and (cached_response := _get_cached_gemini_response(cache_key)) is not None:
+            return iter((cached_response,))
+        
+        model = _get_model(system_prompt)
+        logger.info("🚀 Calling Gemini 2.5 Pro API (streaming)...")
+        response = iter(model.generate_content(user_prompt_parts, stream=True))
+        
+        # Blocked prompts raise here; part-less chunks are skipped until the first text arrives
+        first_text, finish_reason = "", FinishReason.FINISH_REASON_UNSPECIFIED
+        for chunk in response:
+            first_text, finish_reason = _read_stream_chunk(chunk)
+            if first_text:
+                break
+        if not first_text:
+            logger.error(f"❌ Gemini returned empty response (finish_reason: {finish_reason.name})")
+            raise ValueError(f"Gemini returned empty response (finish_reason: {finish_reason.name})")
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"❌ Gemini API Error: {error_msg}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error calling Gemini API: {error_msg}"
+        )
+    
+    return _relay_gemini_stream(first_text, finish_reason, response, cache_key)
+
+def _relay_gemini_stream(first_text: str, finish_reason: Any, response: Iterator[Any], cache_key: bytes) -> Iterator[str]:
+    chunks = [first_text]
+    yield first_text
+    try:
+        for chunk in response:
+            text, finish_reason = _read_stream_chunk(chunk)
+            if text:
+                chunks.append(text)
+                yield text
+    except Exception as e:
+        # Headers are already sent, so flag the truncation in the body and skip caching
+        logger.error(f"❌ Gemini stream interrupted: {str(e)}")
+        yield GEMINI_STREAM_ERROR_MARKER
+        return
+    
+    if finish_reason not in GEMINI_STREAM_OK_FINISH_REASONS:
+        # e.g. SAFETY or RECITATION: the stream ended cleanly but the answer was cut off
+        logger.error(f"❌ Gemini stream stopped early (finish_reason: {finish_reason.name})")
+        yield GEMINI_STREAM_ERROR_MARKER
+        return
+    
+    full_text = "".join(chunks)
+
+    logger.info(f"✅ Gemini API stream completed ({len(full_text)} characters)")
+    with GEMINI_RESPONSE_CACHE_LOCK:
+        GEMINI_RESPONSE_CACHE[cache_key] = full_text
+
 # --- 4. FASTAPI APPLICATION ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared client (and its SSL context) at startup rather than on the first request
+    get_clickup_http_client()
+    yield
+    await close_clickup_http_client()
+
 app = FastAPI(
     title="ClickUp AI Agent Service",
     description="Processes transcripts to suggest ClickUp actions using a user's OAuth token.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# At most this many full tracebacks per minute; the rest are logged as one line so an
+# upstream outage doesn't spend the service's CPU formatting identical stack traces
+MAX_TRACEBACKS_PER_MINUTE = 5
+_RECENT_TRACEBACKS = TTLCache(maxsize=MAX_TRACEBACKS_PER_MINUTE, ttl=60)
+_traceback_ids = itertools.count()
+
+def _log_unexpected_error(e: Exception):
+    if len(_RECENT_TRACEBACKS) < MAX_TRACEBACKS_PER_MINUTE:
+        _RECENT_TRACEBACKS[next(_traceback_ids)] = True
+        logger.exception("❌ Unexpected error in /process-transcript")
+    else:
+        logger.warning(f"❌ Unexpected error in /process-transcript (traceback suppressed): {e!r}")
+
 class ProcessRequest(BaseModel):
     space_id: str
     transcript: str
 
-@app.post("/process-transcript")
+class ProcessResponse(BaseModel):
+    ai_response: str
+
+# The response model lets FastAPI serialize the result with Pydantic directly
+@app.post("/process-transcript", response_model=ProcessResponse)
 async def process_transcript_and_get_actions(
     request: ProcessRequest,
-    auth: HTTPAuthorizationCredentials = Security(token_auth_scheme)
+    auth: HTTPAuthorizationCredentials = Security(token_auth_scheme),
+    x_refresh: bool = Header(False),
+    nocache: bool = Query(False),
+    stream: bool = Query(False)
 ):
     """Process meeting transcript and generate ClickUp actions"""
     logger.info("=" * 80)
@@ -359,37 +687,55 @@ async def process_transcript_and_get_actions(
         user_clickup_token = auth.credentials
         logger.info(f"🔑 Token received: {user_clickup_token[:20]}...")
         
-        clickup_client = ClickUpClient(api_token=user_clickup_token)
+        # Send "X-Refresh: true" to bypass cached ClickUp metadata
+        clickup_client = AsyncClickUpClient(api_token=user_clickup_token, refresh=x_refresh)
         prompt_generator = PromptGenerator(client=clickup_client)
         
         # Fetch and process data
-        logger.info("📊 Step 1: Fetching raw tasks from ClickUp")
-        raw_tasks = clickup_client.get_all_tasks_in_space(request.space_id)
+        # Board tasks and prompt metadata don't depend on each other, so fetch them together
+        logger.info("📊 Step 1: Fetching raw tasks and creating system prompt from ClickUp")
+        raw_tasks, system_prompt = await asyncio.gather(
+            clickup_client.get_all_tasks_in_space(request.space_id),
+            prompt_generator.create_system_prompt(request.space_id)
+        )
         
+        # Filtering and the Gemini SDK are blocking, so run them off the event loop
         logger.info("🔍 Step 2: Filtering tasks")
-        filtered_board_state = filter_clickup_tasks(raw_tasks)
-        
-        logger.info("🔧 Step 3: Creating system prompt")
-        system_prompt = prompt_generator.create_system_prompt(request.space_id)
+        filtered_board_state = await asyncio.to_thread(filter_clickup_tasks, raw_tasks)
         
         # Call Gemini
-        logger.info("🤖 Step 4: Calling Gemini API")
-        gemini_response = call_gemini_api(
+        logger.info("🤖 Step 3: Calling Gemini API")
+        if stream:
+            # ?stream=1 returns Gemini's raw text as it is generated instead of the JSON envelope
+            gemini_stream = await asyncio.to_thread(
+                stream_gemini_api,
+                system_prompt=system_prompt,
+                board_state=filtered_board_state,
+                transcript=request.transcript,
+                use_cache=not nocache
+            )
+            logger.info("✅ REQUEST STREAMING STARTED")
+            logger.info("=" * 80)
+            return StreamingResponse(gemini_stream, media_type="text/plain; charset=utf-8")
+        
+        gemini_response = await asyncio.to_thread(
+            call_gemini_api,
             system_prompt=system_prompt,
             board_state=filtered_board_state,
-            transcript=request.transcript
+            transcript=request.transcript,
+            use_cache=not nocache
         )
         
         logger.info("✅ REQUEST COMPLETED SUCCESSFULLY")
         logger.info("=" * 80)
         
-        return {"ai_response": gemini_response}
+        return ProcessResponse(ai_response=gemini_response)
         
     except HTTPException as e:
         logger.error(f"❌ HTTP Exception: {e.status_code} - {e.detail}")
         raise
     except Exception as e:
-        logger.error(f"❌ Unexpected error: {str(e)}", exc_info=True)
+        _log_unexpected_error(e)
         raise HTTPException(
             status_code=500,
             detail=f"Unexpected error: {str(e)}"
@@ -2,11 +2,15 @@ import os
 import torch
 import torchaudio
 import warnings
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional
 import tempfile
 import json
 import base64
+import hashlib
+import time
+import io
 import soundfile as sf
+import aiofiles
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.concurrency import run_in_threadpool
@@ -20,7 +24,10 @@ import logging
 from pathlib import Path
 import gc
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # --- Basic Configuration ---
 logging.basicConfig(
@@ -32,10 +39,35 @@ warnings.filterwarnings("ignore", category=UserWarning)
 
 # --- Constants ---
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
 SUPPORTED_FORMATS = {'.wav', '.mp3', '.m4a', '.flac', '.ogg', '.webm'}
 CONFIDENCE_THRESHOLD = 0.50
 MIN_AUDIO_LENGTH = 16000  # Samples at 16kHz = 1 second
+EMBEDDING_DIM = 192  # spkrec-ecapa-voxceleb voiceprint size; enrolled voiceprints must match it
+MAX_BATCH_SAMPLES = 16000 * 600  # Padded samples per voiceprint forward pass (10 minutes of audio)
+# Each speaker's voiceprint is built from at most this much of their speech, on every device, so the
+# identification result doesn't depend on the host; 0 uses all of it (and leaves padded shapes unbounded)
+MAX_EMBEDDING_SECONDS = int(os.getenv("MAX_EMBEDDING_SECONDS", "128"))
+MAX_EMBEDDING_SAMPLES = MAX_EMBEDDING_SECONDS * 16000
+# With a compiled model or on MPS, batches are padded up to one of these lengths so captured CUDA graphs
+# and cached MPSGraphs get reused; longer clips round up to a multiple of the last bucket
+LENGTH_BUCKETS = tuple(seconds * 16000 for seconds in (1, 2, 4, 8, 16, 32, 64, 128))
+ENABLE_TORCH_COMPILE = os.getenv("ENABLE_TORCH_COMPILE", "1") == "1"
+# Run the ECAPA forward pass under FP16 autocast on GPU devices; embeddings are still compared in FP32
+ENABLE_HALF_PRECISION = os.getenv("ENABLE_HALF_PRECISION", "1") == "1"
 PROCESSING_TIMEOUT = 600  # 10 minutes
+ASSEMBLYAI_HTTP_TIMEOUT = float(os.getenv("ASSEMBLYAI_HTTP_TIMEOUT", "60"))
+# Idle pooled connections outlive the SDK's status-polling interval, so polls skip the TLS handshake
+ASSEMBLYAI_KEEPALIVE_EXPIRY = float(os.getenv("ASSEMBLYAI_KEEPALIVE_EXPIRY", "30"))
+# Flush the device allocator cache every N pipeline runs; 0 keeps PyTorch's caching allocator arena
+CACHE_FLUSH_INTERVAL = int(os.getenv("CACHE_FLUSH_INTERVAL", "0"))
+# Shared pool for ffmpeg exports and clip decoding; bounds concurrent subprocesses across all requests
+IO_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4), thread_name_prefix="audio-io")
+# Decoded enrollment rosters are stored here as [N, D] float32 .npy files, keyed by a hash of the request JSON
+VOICEPRINT_CACHE_DIR = os.getenv("VOICEPRINT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "voiceprint_cache"))
+# Voiceprints are biometric data: keep only a handful of recently used rosters, and only for a day
+VOICEPRINT_CACHE_MAX_ENTRIES = int(os.getenv("VOICEPRINT_CACHE_MAX_ENTRIES", "32"))
+VOICEPRINT_CACHE_TTL = int(os.getenv("VOICEPRINT_CACHE_TTL", str(24 * 3600)))  # seconds
 
 # --- Helper Functions ---
 def base64_to_float_tensor(base64_str: str, device: str) -> Optional[torch.Tensor]:
@@ -43,15 +75,114 @@ def base64_to_float_tensor(base64_str: str, device: str) -> Optional[torch.Tenso
     try:
         decoded_bytes = base64.b64decode(base64_str)
         float_array = np.frombuffer(decoded_bytes, dtype=np.float32)
-        tensor = torch.from_numpy(float_array).to(device)
-        if tensor.numel() == 0 or torch.isnan(tensor).any() or torch.isinf(tensor).any():
+        tensor = torch.from_numpy(float_array)
+        # Validate on the host copy with one fused reduction, before anything is sent to the device
+        if tensor.numel() == 0 or not torch.isfinite(tensor).all():
             logger.warning("Decoded tensor is empty, NaN, or Inf.")
             return None
-        return tensor
+        return tensor.to(device)
     except Exception as e:
         logger.warning(f"Could not decode base64 string: {e}")
         return None
 
+def _open_private(path: str, mode: str):
+    """Opens a new file readable and writable by the service user only."""
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), mode)
+
+def _prune_voiceprint_cache():
+    """Deletes cached rosters past VOICEPRINT_CACHE_TTL, then the least recently used beyond VOICEPRINT_CACHE_MAX_ENTRIES."""
+    try:
+        entries = []
+        for entry in os.scandir(VOICEPRINT_CACHE_DIR):
+            if entry.name.endswith(".npy"):
+                entries.append((entry.stat().st_mtime, entry.path[:-len(".npy")]))
+    except OSError:
+        return
+    entries.sort(reverse=True)
+    expiry = time.time() - VOICEPRINT_CACHE_TTL
+    for i, (mtime, base_path) in enumerate(entries):
+        if i >= VOICEPRINT_CACHE_MAX_ENTRIES or mtime < expiry:
+            for path in (base_path + ".npy", base_path + ".json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def load_enrolled_voiceprints(enrolled_voiceprints_json: str) -> Tuple[List[str], Optional[torch.Tensor]]:
+    """
+    Returns enrolled speaker names and their voiceprints stacked as an [N, D] float32 CPU tensor.
+    Rosters already seen are memory-mapped from VOICEPRINT_CACHE_DIR instead of being base64-decoded again.
+    """
+    digest = hashlib.sha256(enrolled_voiceprints_json.encode("utf-8")).hexdigest()
+    matrix_path = os.path.join(VOICEPRINT_CACHE_DIR, f"{digest}.npy")
+    names_path = os.path.join(VOICEPRINT_CACHE_DIR, f"{digest}.json")
+
+    try:
+        if os.stat(matrix_path).st_mtime >= time.time() - VOICEPRINT_CACHE_TTL:
+            with open(names_path, "r") as f:
+                names = json.load(f)
+            matrix = np.load(matrix_path, mmap_mode='r')
+            if matrix.shape == (len(names), EMBEDDING_DIM):
+                os.utime(matrix_path)  # Mark as recently used for pruning
+                return names, torch.from_numpy(matrix)
+    except (OSError, ValueError):
+        pass
+
+    enrolled_voiceprints_data = json.loads(enrolled_voiceprints_json)
+    decoded = {name: tensor for name, b64 in enrolled_voiceprints_data.items() if (tensor := base64_to_float_tensor(b64, "cpu")) is not None}
+    if not decoded:
+        return [], None
+    mismatched = [name for name, tensor in decoded.items() if tensor.numel() != EMBEDDING_DIM]
+    if mismatched:
+        raise ValueError(f"Expected {EMBEDDING_DIM}-dimensional voiceprints; got other sizes for {mismatched}.")
+    names, matrix = list(decoded.keys()), torch.stack(list(decoded.values()))
+
+    try:
+        os.makedirs(VOICEPRINT_CACHE_DIR, mode=0o700, exist_ok=True)
+        os.chmod(VOICEPRINT_CACHE_DIR, 0o700)
+        # Write under temporary names and rename so concurrent requests never read a partial file
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with _open_private(matrix_path + tmp_suffix, "wb") as f:
+            np.save(f, matrix.numpy())
+        with _open_private(names_path + tmp_suffix, "w") as f:
+            json.dump(names, f)
+        os.replace(names_path + tmp_suffix, names_path)
+        os.replace(matrix_path + tmp_suffix, matrix_path)
+        _prune_voiceprint_cache()
+    except OSError as e:
+        logger.warning(f"Could not cache enrolled voiceprints: {e}")
+    return names, matrix
+
+def parse_enrolled_matrix(matrix_bytes: bytes, enrolled_names_json: str) -> Tuple[List[str], Optional[torch.Tensor]]:
+    """
+    Reads enrolled voiceprints sent as raw little-endian float32 [N, D] bytes, with row order
+    given by a {"names": [...]} sidecar. Rows that are empty of signal or non-finite are dropped.
+    """
+    names = json.loads(enrolled_names_json).get("names", [])
+    if not names:
+        return [], None
+    if len(matrix_bytes) != 4 * EMBEDDING_DIM * len(names):
+        raise ValueError(f"Voiceprint payload of {len(matrix_bytes)} bytes does not hold {len(names)} float32 rows of {EMBEDDING_DIM}.")
+    matrix = torch.from_numpy(np.frombuffer(matrix_bytes, dtype='<f4').reshape(len(names), EMBEDDING_DIM))
+    valid = torch.isfinite(matrix).all(dim=1)
+    if not valid.all():
+        logger.warning(f"Dropping {int((~valid).sum())} enrolled voiceprints containing NaN or Inf.")
+        names = [name for name, keep in zip(names, valid.tolist()) if keep]
+        matrix = matrix[valid]
+    return (names, matrix) if names else ([], None)
+
+@functools.lru_cache(maxsize=16)
+def get_resampler(orig_freq: int, new_freq: int, device: str = "cpu") -> torchaudio.transforms.Resample:
+    """Returns a shared Resample transform so its sinc filter kernel is built once per rate pair."""
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq).to(device)
+
+def encode_snippet_b64(snippet: AudioSegment) -> str:
+    """Encodes an audio snippet as an MP3 data URI, entirely in memory."""
+    buffer = io.BytesIO()
+    snippet.export(buffer, format="mp3")
+    encoded = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return f"data:audio/mp3;base64,{encoded}"
+
 def validate_audio_file(file_path: str) -> bool:
     """Validates audio file format and size."""
     path = Path(file_path)
@@ -67,7 +198,12 @@ class AssemblyAIHandler:
     def __init__(self, api_key: str):
         if not api_key: raise ValueError("AssemblyAI API key is required.")
         aai.settings.api_key = api_key
-        self.transcriber = aai.Transcriber()
+        aai.settings.http_timeout = ASSEMBLYAI_HTTP_TIMEOUT
+        if hasattr(aai.settings, "keepalive_expiry"):  # Older SDKs don't expose pool settings
+            aai.settings.keepalive_expiry = ASSEMBLYAI_KEEPALIVE_EXPIRY
+        # One client for the life of the process, so the upload and every status poll reuse pooled connections
+        self.client = aai.Client(settings=aai.settings)
+        self.transcriber = aai.Transcriber(client=self.client)
         logger.info("AssemblyAI handler initialized.")
 
     def transcribe_and_extract(self, audio_path: str, temp_dir: str) -> Tuple[aai.Transcript, Dict[str, str], Dict[str, str]]:
@@ -86,26 +222,40 @@ class AssemblyAIHandler:
         logger.info(f"Transcription complete. Found {len(transcript.utterances)} utterances.")
         
         original_audio = AudioSegment.from_file(audio_path)
+
+        # Collect each speaker's PCM byte ranges and join them once; appending AudioSegments
+        # copies the whole accumulated buffer on every utterance.
+        raw_audio = memoryview(original_audio.raw_data)
+        frame_rate, frame_width = original_audio.frame_rate, original_audio.frame_width
+        utterances = transcript.utterances
+        # Millisecond timestamps -> byte offsets for every utterance at once
+        starts = np.fromiter((utt.start for utt in utterances), dtype=np.int64, count=len(utterances))
+        ends = np.fromiter((utt.end for utt in utterances), dtype=np.int64, count=len(utterances))
+        start_bytes = (starts * frame_rate // 1000) * frame_width
+        end_bytes = (ends * frame_rate // 1000) * frame_width
+        speakers, speaker_index = np.unique([utt.speaker for utt in utterances], return_inverse=True)
         speaker_segments = {}
-        for utterance in transcript.utterances:
-            speaker = utterance.speaker
-            clip = original_audio[utterance.start:utterance.end]
-            speaker_segments.setdefault(speaker, AudioSegment.empty())
-            speaker_segments[speaker] += clip
-
-        speaker_paths = {}
-        speaker_snippets_b64 = {}
-        for speaker, audio in speaker_segments.items():
-            speaker_file_path = os.path.join(temp_dir, f"SPEAKER_{speaker}.wav")
-            audio.export(speaker_file_path, format="wav")
-            speaker_paths[speaker] = speaker_file_path
-            
-            snippet = audio[:5000]
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as snippet_file:
-                snippet.export(snippet_file.name, format="mp3")
-                with open(snippet_file.name, "rb") as f:
-                    encoded = base64.b64encode(f.read()).decode('utf-8')
-                    speaker_snippets_b64[speaker] = f"data:audio/mp3;base64,{encoded}"
+        for i, speaker in enumerate(speakers.tolist()):
+            idx = np.flatnonzero(speaker_index == i)
+            chunks = [raw_audio[b0:b1] for b0, b1 in zip(start_bytes[idx].tolist(), end_bytes[idx].tolist())]
+            speaker_segments[speaker] = original_audio._spawn(b"".join(chunks))
+
+        speaker_paths = {
+            speaker: os.path.join(temp_dir, f"SPEAKER_{speaker}.wav") for speaker in speaker_segments
+        }
+
+        # Each export runs its own ffmpeg process, so run the WAV exports and snippet encodes concurrently
+        export_futures = [
+            IO_POOL.submit(audio.export, speaker_paths[speaker], format="wav")
+            for speaker, audio in speaker_segments.items()
+        ]
+        snippet_futures = {
+            speaker: IO_POOL.submit(encode_snippet_b64, audio[:5000])
+            for speaker, audio in speaker_segments.items()
+        }
+        for future in export_futures:
+            future.result().close()
+        speaker_snippets_b64 = {speaker: future.result() for speaker, future in snippet_futures.items()}
             
         return transcript, speaker_paths, speaker_snippets_b64
 
@@ -131,78 +281,231 @@ class SpeechBrainIdentifier:
         )
         logger.info("SpeechBrain model loaded successfully.")
 
+        self.autocast_dtype = torch.float16 if self.device in ("cuda", "mps") and ENABLE_HALF_PRECISION else None
+        if self.autocast_dtype is not None:
+            logger.info(f"ECAPA forward pass will run under {self.autocast_dtype} autocast.")
+
+        self._eager_embedding_model = None
+        self._compile_embedding_model()
+
+        self._runs_since_flush = 0
+        self._flush_lock = threading.Lock()
+
+    def _compile_embedding_model(self):
+        """Compiles the ECAPA embedding model with CUDA graphs; other devices stay in eager mode."""
+        if self.device != "cuda" or not ENABLE_TORCH_COMPILE:
+            return
+        try:
+            eager_model = self.classifier.mods.embedding_model
+            self.classifier.mods.embedding_model = torch.compile(eager_model, mode="reduce-overhead", dynamic=False)
+            # Every bucketed (batch size, length) pair is its own graph; keep dynamo from giving up on them
+            last_bucket = LENGTH_BUCKETS[-1]
+            bucket_lengths = LENGTH_BUCKETS + tuple(range(2 * last_bucket, MAX_EMBEDDING_SAMPLES + last_bucket, last_bucket))
+            shape_count = sum(max(MAX_BATCH_SAMPLES // bucket, 1).bit_length() for bucket in bucket_lengths)
+            torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, shape_count)
+            self._eager_embedding_model = eager_model
+            logger.info("ECAPA embedding model compiled with torch.compile (reduce-overhead).")
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable, using eager embedding model: {e}")
+
+    def _run_encoder(self, batch: torch.Tensor, wav_lens: torch.Tensor) -> torch.Tensor:
+        """Calls encode_batch, permanently falling back to the eager model if the compiled one fails."""
+        try:
+            return self.classifier.encode_batch(batch, wav_lens, normalize=False)
+        except Exception as e:
+            # Compilation happens lazily on the first call, so failures only surface here
+            if self._eager_embedding_model is None:
+                raise
+            logger.warning(f"Compiled embedding model failed, falling back to eager mode: {e}")
+            self.classifier.mods.embedding_model = self._eager_embedding_model
+            self._eager_embedding_model = None
+            return self.classifier.encode_batch(batch, wav_lens, normalize=False)
+
+    def _autocast(self):
+        """Mixed-precision context for the encoder; a no-op on CPU or when half precision is disabled."""
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device, dtype=self.autocast_dtype)
+
+    def _uses_shape_buckets(self) -> bool:
+        """Whether input shapes are bucketed so cached graphs (CUDA graphs, MPSGraph) get reused."""
+        return self._eager_embedding_model is not None or self.device == "mps"
+
+    def _padded_length(self, num_samples: int) -> int:
+        """Length a signal is padded to for encoding: at least MIN_AUDIO_LENGTH, bucketed when graphs are cached."""
+        length = max(num_samples, MIN_AUDIO_LENGTH)
+        if self._uses_shape_buckets():
+            last_bucket = LENGTH_BUCKETS[-1]
+            length = next((bucket for bucket in LENGTH_BUCKETS if bucket >= length), -(-length // last_bucket) * last_bucket)
+        return length
+
+    def _padded_batch_size(self, batch_size: int) -> int:
+        """Number of rows a batch is padded to: the next power of two when graphs are cached."""
+        if self._uses_shape_buckets():
+            return 1 << (batch_size - 1).bit_length()
+        return batch_size
+
     def _clear_cache(self):
         """Clear cache to prevent memory buildup."""
         if self.device == "cuda": torch.cuda.empty_cache()
         if self.device == "mps": torch.mps.empty_cache()
         gc.collect()
 
-    def _create_voiceprint_from_audio(self, audio_path: str) -> Optional[torch.Tensor]:
-        """Creates a voiceprint embedding from an audio file using a robust method."""
-        try:
-            # NEW: Use pydub for robust audio loading and standardization.
-            audio = AudioSegment.from_file(audio_path)
-            audio = audio.set_frame_rate(16000).set_channels(1)
-
-            # Convert to a normalized float32 numpy array.
-            # Raw data is int16, so we divide by 2**15 to get floats in [-1, 1].
-            samples = np.array(audio.get_array_of_samples(), dtype=np.float32) / (2**15)
-            
-            if samples.size == 0:
-                logger.warning(f"Audio file seems to be empty after loading: {audio_path}")
-                return None
-
-            signal_tensor = torch.from_numpy(samples).unsqueeze(0).to(self.device)
-
-            if signal_tensor.shape[1] < MIN_AUDIO_LENGTH:
-                padding = torch.zeros((1, MIN_AUDIO_LENGTH - signal_tensor.shape[1]), device=self.device)
-                signal_tensor = torch.cat([signal_tensor, padding], dim=1)
-
-            with torch.no_grad():
-                embedding = self.classifier.encode_batch(signal_tensor)
-                normalized = torch.nn.functional.normalize(embedding, p=2, dim=2).squeeze()
-                if torch.isnan(normalized).any() or torch.isinf(normalized).any():
-                    logger.warning(f"Voiceprint for {audio_path} contains NaN or Inf.")
+    def release_memory_periodically(self):
+        """Clears the cache once every CACHE_FLUSH_INTERVAL calls; does nothing when the interval is 0."""
+        if CACHE_FLUSH_INTERVAL <= 0:
+            return
+        with self._flush_lock:
+            self._runs_since_flush += 1
+            if self._runs_since_flush < CACHE_FLUSH_INTERVAL:
+                return
+            self._runs_since_flush = 0
+        self._clear_cache()
+
+    def _load_wav_signal(self, audio_path: str) -> torch.Tensor:
+        """Reads a WAV file directly with soundfile, skipping the ffmpeg round-trip."""
+        samples, fs = sf.read(audio_path, dtype='float32', always_2d=False)
+        if samples.ndim == 2:
+            samples = samples.mean(axis=1)
+        signal = torch.from_numpy(np.ascontiguousarray(samples))
+        if fs != 16000:
+            signal = get_resampler(fs, 16000)(signal)
+        return signal
+
+    def _load_signal(self, audio_path: str) -> Optional[torch.Tensor]:
+        """Loads an audio file as a 1-D float32 CPU tensor at 16kHz mono, normalized to [-1, 1]."""
+        # Fast path: the speaker clips exported by transcribe_and_extract are always WAV.
+        if audio_path.lower().endswith('.wav'):
+            try:
+                signal = self._load_wav_signal(audio_path)
+                if signal.numel() == 0:
+                    logger.warning(f"Audio file seems to be empty after loading: {audio_path}")
                     return None
-                return normalized.cpu().clone()
-        except Exception as e:
-            logger.error(f"Could not create voiceprint for {audio_path}: {e}", exc_info=True)
-            return None
-        finally:
-            self._clear_cache()
+                return signal
+            except Exception as e:
+                logger.warning(f"Direct WAV load failed for {audio_path}, falling back to pydub: {e}")
 
-    def identify_speakers(self, unknown_clips: Dict[str, str], enrolled_voiceprints: Dict[str, torch.Tensor]) -> Dict[str, str]:
-        """Finds optimal mapping of unknown speakers to enrolled speakers."""
-        if not enrolled_voiceprints:
-            return {label: f"Unknown Speaker {i+1}" for i, label in enumerate(sorted(unknown_clips.keys()))}
+        # Use pydub for robust audio loading and standardization.
+        audio = AudioSegment.from_file(audio_path)
+        audio = audio.set_frame_rate(16000).set_channels(1)
 
-        # MODIFICATION: Process voiceprint creation sequentially for stability in Docker.
-        logger.info(f"Creating voiceprints for {len(unknown_clips)} unknown speakers sequentially...")
-        unknown_voiceprints = {}
+        # Raw data is int16, so we divide by 2**15 to get floats in [-1, 1].
+        samples = np.array(audio.get_array_of_samples(), dtype=np.float32) / (2**15)
         
-        for i, (label, path) in enumerate(unknown_clips.items()):
-            logger.info(f"({i+1}/{len(unknown_clips)}) Processing voiceprint for speaker {label}...")
-            vp = self._create_voiceprint_from_audio(path)
-            if vp is not None:
-                unknown_voiceprints[label] = vp
-                logger.info(f"({i+1}/{len(unknown_clips)}) Successfully created voiceprint for {label}.")
-            else:
-                logger.warning(f"({i+1}/{len(unknown_clips)}) Failed to create voiceprint for {label}.")
+        if samples.size == 0:
+            logger.warning(f"Audio file seems to be empty after loading: {audio_path}")
+            return None
+        return torch.from_numpy(samples)
+
+    def _plan_batches(self, signals: Dict[str, torch.Tensor]) -> List[List[str]]:
+        """Groups labels longest-first so each padded batch stays within MAX_BATCH_SAMPLES."""
+        batches, current, current_len = [], [], 0
+        for label in sorted(signals, key=lambda l: signals[l].shape[0], reverse=True):
+            padded_len = self._padded_length(signals[label].shape[0])
+            if current and self._padded_batch_size(len(current) + 1) * current_len > MAX_BATCH_SAMPLES:
+                batches.append(current)
+                current = []
+            if not current:
+                current_len = padded_len
+            current.append(label)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _encode_batch(self, labels: List[str], signals: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """Runs one ECAPA forward pass over the padded signals for the given labels."""
+        batch_signals = [signals[label] for label in labels]
+        # Filler rows repeat the last clip so they encode cleanly; zip() with labels below discards them
+        batch_signals += [batch_signals[-1]] * (self._padded_batch_size(len(batch_signals)) - len(batch_signals))
+        # Clips shorter than MIN_AUDIO_LENGTH count their zero padding as signal, as before batching
+        lengths = torch.tensor([max(sig.shape[0], MIN_AUDIO_LENGTH) for sig in batch_signals])
+        max_len = self._padded_length(int(lengths.max()))
+        batch = torch.nn.utils.rnn.pad_sequence(batch_signals, batch_first=True)
+        if batch.shape[1] < max_len:
+            batch = torch.nn.functional.pad(batch, (0, max_len - batch.shape[1]))
+        wav_lens = lengths.float() / max_len
+        if self.device == "cuda":
+            # Page-locked host buffers let the non_blocking copies below run asynchronously
+            batch, wav_lens = batch.pin_memory(), wav_lens.pin_memory()
+
+        with torch.inference_mode():
+            # FP32 weights and inputs stay as-is; autocast runs the conv/TDNN stack in half precision
+            with self._autocast():
+                embeddings = self._run_encoder(
+                    batch.to(self.device, non_blocking=True),
+                    wav_lens.to(self.device, non_blocking=True)
+                )
+            # Normalize in FP32 so cosine similarities are computed at full precision
+            normalized = torch.nn.functional.normalize(embeddings.squeeze(1).float(), p=2, dim=1)
+            # One host transfer for the whole batch's validity mask; the voiceprints stay on device
+            finite = torch.isfinite(normalized).all(dim=1).tolist()
+
+        voiceprints = {}
+        for label, vp, is_finite in zip(labels, normalized, finite):
+            if not is_finite:
+                logger.warning(f"Voiceprint for speaker {label} contains NaN or Inf.")
+                continue
+            voiceprints[label] = vp
+        return voiceprints
+
+    def _batch_voiceprints(self, paths: Dict[str, str]) -> Dict[str, torch.Tensor]:
+        """
+        Creates voiceprints for all audio files, encoding them in as few forward passes as possible.
+
+        Clips are decoded here into 16kHz mono float32 tensors and trimmed to MAX_EMBEDDING_SAMPLES
+        (identically on every device), so SpeechBrain only ever sees a padded
+        [B, T] batch plus relative wav_lens: its load_audio path is never used and embedding
+        mean/variance normalization is disabled (normalize=False). Returned voiceprints are
+        L2-normalized, finite, live on self.device, and are keyed in the order of `paths`.
+        """
+        signals = {}
+        # Decoding is I/O and ffmpeg bound, so load every clip concurrently
+        futures = {label: IO_POOL.submit(self._load_signal, path) for label, path in paths.items()}
+        for label, future in futures.items():
+            try:
+                signal = future.result()
+            except Exception as e:
+                logger.error(f"Could not load audio for speaker {label}: {e}", exc_info=True)
+                continue
+            if signal is not None:
+                # Concatenated speaker audio can run for many minutes; a couple of minutes is ample for ECAPA
+                if MAX_EMBEDDING_SAMPLES > 0:
+                    signal = signal[:MAX_EMBEDDING_SAMPLES]
+                signals[label] = signal
+
+        voiceprints = {}
+        for labels in self._plan_batches(signals):
+            try:
+                voiceprints.update(self._encode_batch(labels, signals))
+            except Exception as e:
+                logger.error(f"Could not create voiceprints for speakers {labels}: {e}", exc_info=True)
+        # Batches are length-ordered; hand results back in the caller's speaker order
+        return {label: voiceprints[label] for label in paths if label in voiceprints}
+
+    def identify_speakers(self, unknown_clips: Dict[str, str], enrolled_names: List[str], enrolled_matrix: Optional[torch.Tensor]) -> Dict[str, str]:
+        """Finds optimal mapping of unknown speakers to enrolled speakers, given enrolled voiceprints as [N, D] rows."""
+        if not enrolled_names:
+            return {label: f"Unknown Speaker {i+1}" for i, label in enumerate(sorted(unknown_clips.keys()))}
 
+        logger.info(f"Creating voiceprints for {len(unknown_clips)} unknown speakers in batch...")
+        unknown_voiceprints = self._batch_voiceprints(unknown_clips)
+        for label in unknown_clips:
+            if label not in unknown_voiceprints:
+                logger.warning(f"Failed to create voiceprint for {label}.")
+        logger.info(f"Created {len(unknown_voiceprints)}/{len(unknown_clips)} unknown speaker voiceprints.")
 
         if not unknown_voiceprints:
             logger.warning("No valid unknown speaker voiceprints could be created.")
             return {label: f"Unknown Speaker {i+1}" for i, label in enumerate(sorted(unknown_clips.keys()))}
 
-        enrolled_names, unknown_labels = list(enrolled_voiceprints.keys()), list(unknown_voiceprints.keys())
-        similarity_matrix = np.zeros((len(enrolled_names), len(unknown_labels)))
-        cosine_similarity = torch.nn.CosineSimilarity(dim=0)
+        unknown_labels = list(unknown_voiceprints.keys())
 
-        for i, name in enumerate(enrolled_names):
-            for j, label in enumerate(unknown_labels):
-                enrolled_vp = enrolled_voiceprints[name].to(self.device)
-                unknown_vp = unknown_voiceprints[label].to(self.device)
-                similarity_matrix[i, j] = cosine_similarity(enrolled_vp, unknown_vp).item()
+        # Cosine similarity of every enrolled/unknown pair as one matmul of L2-normalized rows.
+        # Unknown voiceprints are already normalized on device; the matrix is the only device->host copy.
+        with torch.inference_mode():
+            enrolled_matrix = torch.nn.functional.normalize(enrolled_matrix.to(self.device, non_blocking=True), p=2, dim=1)
+            unknown_matrix = torch.stack(list(unknown_voiceprints.values()))
+            similarity_matrix = (enrolled_matrix @ unknown_matrix.T).cpu().numpy()
 
         row_ind, col_ind = linear_sum_assignment(1 - similarity_matrix)
         speaker_map = {}
@@ -220,11 +523,12 @@ class SpeechBrainIdentifier:
         return speaker_map
 
 # --- Synchronous Pipeline ---
-def run_transcription_pipeline(main_audio_path: str, temp_dir: str, enrolled_voiceprints: Dict[str, torch.Tensor], assembly_handler: AssemblyAIHandler, speechbrain_identifier: SpeechBrainIdentifier) -> Dict[str, Any]:
+def run_transcription_pipeline(main_audio_path: str, temp_dir: str, enrolled_names: List[str], enrolled_matrix: Optional[torch.Tensor], assembly_handler: AssemblyAIHandler, speechbrain_identifier: SpeechBrainIdentifier) -> Dict[str, Any]:
     """Runs the complete transcription and identification pipeline."""
     try:
         transcript, unknown_clips, unknown_snippets = assembly_handler.transcribe_and_extract(main_audio_path, temp_dir)
-        speaker_map = speechbrain_identifier.identify_speakers(unknown_clips, enrolled_voiceprints)
+        speaker_map = speechbrain_identifier.identify_speakers(unknown_clips, enrolled_names, enrolled_matrix)
+        speechbrain_identifier.release_memory_periodically()
 
         final_transcript = [{"speaker": speaker_map.get(utt.speaker, utt.speaker), "text": utt.text, "start_ms": utt.start, "end_ms": utt.end} for utt in transcript.utterances]
         unresolved_speakers = [{"label": final_name, "audio_snippet_b64": unknown_snippets.get(original_label)} for original_label, final_name in speaker_map.items() if "Unknown Speaker" in final_name]
@@ -246,31 +550,63 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True,
 assembly_handler = AssemblyAIHandler(api_key=ASSEMBLYAI_API_KEY)
 speechbrain_identifier = SpeechBrainIdentifier()
 
+@app.on_event("shutdown")
+def shutdown_io_pool():
+    """Lets in-flight exports finish and stops the shared I/O pool."""
+    IO_POOL.shutdown(wait=True)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "device": speechbrain_identifier.device}
 
 @app.post("/process-audio")
-async def process_audio_endpoint(audio_file: UploadFile = File(...), enrolled_voiceprints_json: str = Form(...)):
-    """Main endpoint for processing audio files."""
+async def process_audio_endpoint(
+    audio_file: UploadFile = File(...),
+    enrolled_voiceprints: Optional[UploadFile] = File(None),
+    enrolled_names_json: Optional[str] = Form(None),
+    enrolled_voiceprints_json: Optional[str] = Form(None)
+):
+    """
+    Main endpoint for processing audio files. Enrolled voiceprints arrive either as a raw float32
+    [N, D] file plus an enrolled_names_json sidecar, or as the legacy JSON map of base64 strings.
+    """
     try:
-        enrolled_voiceprints_data = json.loads(enrolled_voiceprints_json)
-        device = speechbrain_identifier.device
-        enrolled_voiceprints = {name: tensor for name, b64 in enrolled_voiceprints_data.items() if (tensor := base64_to_float_tensor(b64, device)) is not None}
-        logger.info(f"Loaded {len(enrolled_voiceprints)} valid voiceprints.")
+        if enrolled_voiceprints is not None:
+            if not enrolled_names_json:
+                raise HTTPException(status_code=400, detail="enrolled_names_json is required with enrolled_voiceprints.")
+            try:
+                enrolled_names, enrolled_matrix = parse_enrolled_matrix(await enrolled_voiceprints.read(), enrolled_names_json)
+            except (ValueError, AttributeError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid enrolled voiceprints: {e}")
+        elif enrolled_voiceprints_json is not None:
+            # Hashing, decoding and cache file I/O are blocking; keep them off the event loop
+            try:
+                enrolled_names, enrolled_matrix = await run_in_threadpool(load_enrolled_voiceprints, enrolled_voiceprints_json)
+            except json.JSONDecodeError:
+                raise
+            except (ValueError, AttributeError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid enrolled voiceprints: {e}")
+        else:
+            raise HTTPException(status_code=400, detail="Enrolled voiceprints are required.")
+        logger.info(f"Loaded {len(enrolled_names)} valid voiceprints.")
 
         with tempfile.TemporaryDirectory() as temp_dir:
             main_audio_path = os.path.join(temp_dir, audio_file.filename)
-            with open(main_audio_path, "wb") as buffer:
-                content = await audio_file.read()
-                if not content: raise HTTPException(status_code=400, detail="Uploaded file is empty")
-                buffer.write(content)
+            # Stream the upload to disk in chunks rather than holding the whole file in memory
+            total_size = 0
+            async with aiofiles.open(main_audio_path, "wb") as buffer:
+                while chunk := await audio_file.read(UPLOAD_CHUNK_SIZE):
+                    total_size += len(chunk)
+                    if total_size > MAX_FILE_SIZE:
+                        raise HTTPException(status_code=413, detail=f"Audio file exceeds {MAX_FILE_SIZE // (1024*1024)}MB")
+                    await buffer.write(chunk)
+            if total_size == 0: raise HTTPException(status_code=400, detail="Uploaded file is empty")
 
             result = await asyncio.wait_for(
                 run_in_threadpool(
                     run_transcription_pipeline,
-                    main_audio_path, temp_dir, enrolled_voiceprints,
+                    main_audio_path, temp_dir, enrolled_names, enrolled_matrix,
                     assembly_handler, speechbrain_identifier
                 ),
                 timeout=PROCESSING_TIMEOUT
@@ -280,6 +616,8 @@ async def process_audio_endpoint(audio_file: UploadFile = File(...), enrolled_vo
         raise HTTPException(status_code=504, detail=f"Processing timed out after {PROCESSING_TIMEOUT} seconds.")
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON format for voiceprints.")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"An error occurred: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
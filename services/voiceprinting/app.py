@@ -1,10 +1,14 @@
 import os
+import io
+import base64
+import contextlib
+import functools
 import torch
 import torchaudio
-import tempfile
 import json
 import warnings
-from pathlib import Path
+import numpy as np
+from typing import Optional, Tuple, Union
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from speechbrain.pretrained import EncoderClassifier
 import soundfile as sf
@@ -13,12 +17,21 @@ from pydub import AudioSegment
 # Suppress user warnings for a cleaner output
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# Run the ECAPA forward pass under FP16 autocast on CUDA/MPS; the returned embedding is always FP32
+ENABLE_HALF_PRECISION = os.getenv("ENABLE_HALF_PRECISION", "1") == "1"
+
 # --- AI Model Initialization ---
 CLASSIFIER = None
 DEVICE = "cpu"
 try:
     print("🧠 Initializing SpeechBrain model...")
-    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    # Same device preference as the transcription service: Apple's Metal (MPS), then CUDA, then CPU.
+    if torch.backends.mps.is_available() and torch.backends.mps.is_built():
+        DEVICE = "mps"
+    elif torch.cuda.is_available():
+        DEVICE = "cuda"
+    else:
+        DEVICE = "cpu"
     CLASSIFIER = EncoderClassifier.from_hparams(
         source="speechbrain/spkrec-ecapa-voxceleb",
         savedir="pretrained_models/spkrec-ecapa-voxceleb",
@@ -32,31 +45,56 @@ except Exception as e:
 # --- FastAPI Application Setup ---
 app = FastAPI(title="Voiceprint Generation Service")
 
-def create_voiceprint(audio_file_path: str):
+@functools.lru_cache(maxsize=16)
+def get_resampler(orig_freq: int, new_freq: int, device: str = "cpu") -> torchaudio.transforms.Resample:
+    """Returns a shared Resample transform so its sinc filter kernel is built once per rate pair."""
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq).to(device)
+
+def decode_audio(content: bytes) -> Tuple[torch.Tensor, int]:
+    """
+    Decodes uploaded audio bytes in memory into a (channels, samples) float tensor and its sample rate.
+    Falls back to pydub (ffmpeg) for formats torchaudio's backend can't read.
     """
-    Processes a 16kHz mono WAV file and returns a voiceprint embedding.
+    try:
+        return torchaudio.load(io.BytesIO(content))
+    except Exception:
+        audio_segment = AudioSegment.from_file(io.BytesIO(content)).set_sample_width(2)
+        samples = np.array(audio_segment.get_array_of_samples(), dtype=np.float32) / (2**15)
+        signal = torch.from_numpy(samples).reshape(-1, audio_segment.channels).T
+        return signal, audio_segment.frame_rate
+
+def create_voiceprint(audio: Union[str, torch.Tensor], sample_rate: Optional[int] = None) -> Optional[str]:
+    """
+    Returns a voiceprint embedding for an audio file path, or for an in-memory
+    (channels, samples) signal tensor recorded at sample_rate, as base64-encoded
+    little-endian float32 bytes (the format the transcription service decodes).
     """
     if not CLASSIFIER:
         raise RuntimeError("SpeechBrain model is not available.")
 
     try:
-        # Load the audio file
-        signal, fs = torchaudio.load(audio_file_path)
+        if isinstance(audio, str):
+            signal, fs = torchaudio.load(audio)
+        else:
+            signal, fs = audio, sample_rate
 
         # Ensure it's mono and resampled to 16kHz
         if fs != 16000:
-            resampler = torchaudio.transforms.Resample(orig_freq=fs, new_freq=16000)
-            signal = resampler(signal)
+            signal = get_resampler(fs, 16000, str(signal.device))(signal)
         if signal.shape[0] > 1:
             signal = torch.mean(signal, dim=0, keepdim=True)
             
         # Generate the embedding
-        with torch.no_grad():
-            embedding = CLASSIFIER.encode_batch(signal)
-            embedding = torch.nn.functional.normalize(embedding, p=2, dim=2)
-            return embedding.squeeze().cpu().tolist()
+        use_autocast = DEVICE in ("cuda", "mps") and ENABLE_HALF_PRECISION
+        autocast = torch.autocast(device_type=DEVICE, dtype=torch.float16) if use_autocast else contextlib.nullcontext()
+        with torch.inference_mode():
+            with autocast:
+                embedding = CLASSIFIER.encode_batch(signal)
+            embedding = torch.nn.functional.normalize(embedding.squeeze().float(), p=2, dim=0)
+            embedding_bytes = embedding.cpu().numpy().astype('<f4', copy=False).tobytes()
+            return base64.b64encode(embedding_bytes).decode('ascii')
     except Exception as e:
-        print(f"Could not process file {audio_file_path}: {e}")
+        print(f"Could not process audio: {e}")
         return None
 
 @app.post('/generate-voiceprint')
@@ -71,25 +109,12 @@ async def handle_generate_voiceprint(
     if not CLASSIFIER:
         raise HTTPException(status_code=503, detail="Voiceprint model is not loaded.")
 
-    temp_original_path = None
-    temp_wav_path = None
     try:
-        # Save the uploaded file to a temporary location
-        suffix = Path(audioFile.filename).suffix
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_original:
-            content = await audioFile.read()
-            temp_original.write(content)
-            temp_original_path = temp_original.name
-
-        # Convert the audio to a standardized 16kHz mono WAV format
-        audio_segment = AudioSegment.from_file(temp_original_path)
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_wav:
-            audio_segment.set_frame_rate(16000).set_channels(1).export(temp_wav.name, format="wav")
-            temp_wav_path = temp_wav.name
+        # Decode the upload in memory; create_voiceprint handles mono conversion and resampling
+        content = await audioFile.read()
+        signal, fs = decode_audio(content)
         
-        # Create the voiceprint from the standardized file
-        embedding = create_voiceprint(temp_wav_path)
+        embedding = create_voiceprint(signal, fs)
         
         if embedding:
             # Save the voiceprint to a local "database" (a folder of JSON files)
@@ -102,19 +127,13 @@ async def handle_generate_voiceprint(
                 json.dump(embedding, f)
             
             print(f"✅ Voiceprint for '{name}' saved to '{output_path}'")
-            return {"embedding": embedding}
+            return {"embedding_b64": embedding}
         else:
             raise HTTPException(status_code=500, detail="Failed to generate voiceprint after audio conversion.")
             
     except Exception as e:
         print(f"An error occurred during audio processing: {e}")
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
-    finally:
-        # Clean up the temporary files
-        if temp_original_path and os.path.exists(temp_original_path):
-            os.remove(temp_original_path)
-        if temp_wav_path and os.path.exists(temp_wav_path):
-            os.remove(temp_wav_path)
 
 @app.get("/health")
 async def health_check():